@@ -1,17 +1,30 @@
 import streamlit as st
 import os
 import json
-from pathlib import Path
+import shutil
+import base64
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import streamlit.components.v1 as components
 import datetime
+# Imported modules run once per process, unlike this script which reruns on every interaction
+from constants import (
+    BASIC_SHAPES, CUTOUT_SHAPES, DRILL_HOLE_OPTIONS, CUTOUT_COUNTS, STEP_PROGRESS, TOTAL_STEPS,
+    CUTOUT_COUNT_LABELS, CUTOUT_COUNT_VALUES, BASIC_SHAPE_INDEX, CUTOUT_SHAPE_INDEX, CUTOUT_COUNT_INDEX,
+    FILTER_FIELDS,
+    BASIC_SHAPE_HTML, CUTOUT_COUNT_HTML, CUTOUT_SHAPE_HTML, DRILL_HOLE_HTML, CUSTOM_CSS, KEYBOARD_SCRIPT
+)
+
+try:
+    import orjson
+except ImportError:  # Fall back to the standard library encoder
+    orjson = None
 
 # Initialize session state
-if 'current_file_index' not in st.session_state:
-    st.session_state.current_file_index = 0
-if 'current_results' not in st.session_state:
-    st.session_state.current_results = {}
-if 'current_step' not in st.session_state:
-    st.session_state.current_step = 'basic_shape'
+st.session_state.setdefault('current_file_index', 0)
+st.session_state.setdefault('current_results', {})
+st.session_state.setdefault('current_step', 'basic_shape')
 
 # Set page config
 st.set_page_config(
@@ -23,220 +36,265 @@ st.set_page_config(
 # Constants
 DEFAULT_IMAGES_DIR = "images"
 TYPING_RESULTS_FILE = "typed_images.json"
-
-# Fixed options
-BASIC_SHAPES = [
-    "Rectangle",
-    "Circle",
-    "Rounded Rectangle",
-    "Arched Rectangle",
-    "Sloped Rectangle",
-    "Trapezoid",
-    "Right Angled Triangle",
-    "Ellipse",
-    "Text",
-    "Other Shape",
-    "Skip Image"  # Moved to end of list
-]
-
-CUTOUT_SHAPES = [
-    "Rectangle",
-    "Circle",
-    "Rounded Rectangle",
-    "Arched Rectangle",
-    "Sloped Rectangle",
-    "Trapezoid",
-    "Right Angled Triangle",
-    "Ellipse",
-    "Text",
-    "Other Shape"
-]
-
-CUTOUT_COUNTS = [
-    {"label": "No cutouts", "value": 0},
-    {"label": "1 cutout", "value": 1},
-    {"label": "2 cutouts", "value": 2},
-    {"label": "3 cutouts", "value": 3},
-    {"label": "Multiple/complex cutouts", "value": -1}  # Special value for complex cutouts
-]
+TYPING_JOURNAL_FILE = "typed_images.log"  # Append-only log of changes since the last compaction
+JOURNAL_COMPACT_THRESHOLD = 500  # Merge the journal into the results file after this many entries
+PREFETCH_COUNT = 8  # Number of upcoming files to read in the background
+RESULTS_PAGE_SIZE = 50  # Number of typed files shown per page in the results tab
 
 # Add custom CSS at the top of the app
-st.markdown("""
-<style>
-    /* Navigation container */
-    div[data-testid="column"] > div:has(button:contains("Previous")),
-    div[data-testid="column"] > div:has(button:contains("Next")) {
-        padding: 0 10px;
-    }
-    
-    /* Navigation buttons */
-    div[data-testid="column"] button:contains("Previous"), 
-    div[data-testid="column"] button:contains("Next") {
-        width: 100%;
-        background-color: white;
-        border: 1px solid #ddd;
-        padding: 0.5rem;
-        border-radius: 0.3rem;
-        display: inline-flex !important;
-        align-items: center;
-        justify-content: center;
-    }
-    
-    div[data-testid="column"] button:contains("Previous")::before {
-        content: "←";
-        margin-right: 0.5rem;
-    }
-    
-    div[data-testid="column"] button:contains("Next")::after {
-        content: "→";
-        margin-left: 0.5rem;
-    }
-    
-    /* Image counter */
-    div[data-testid="column"]:has(> div > p:contains("Image")) {
-        text-align: right;
-    }
-    
-    div[data-testid="column"] p:contains("Image") {
-        color: #666;
-        margin: 0;
-    }
-    
-    /* Hide default Streamlit buttons */
-    div[data-testid="stVerticalBlock"] > div.element-container:has(.typing-button-container) + div.element-container {
-        display: none !important;
-        position: absolute !important;
-        pointer-events: none !important;
-        opacity: 0 !important;
-        height: 0 !important;
-        width: 0 !important;
-        margin: 0 !important;
-        padding: 0 !important;
-        overflow: hidden !important;
-    }
-    
-    /* Position typing buttons */
-    .typing-button-container {
-        width: 100%;
-        margin-bottom: 10px;
-    }
-    
-    /* Option buttons */
-    .option-button {
-        background-color: #f8f9fa;
-        border: 1px solid #dee2e6;
-        border-radius: 0.5rem;
-        padding: 0.5rem;
-        width: 100%;
-        font-size: 1em;
-        line-height: 1.5;
-        color: #333;
-        transition: all 0.2s;
-        cursor: pointer;
-        text-align: left;
-        display: flex;
-        align-items: center;
-    }
-    
-    /* Special style for Skip Image button */
-    .option-button[data-streamlit-key="Skip Image"] {
-        background-color: #ffe6e6;
-        border-color: #ffcccc;
-    }
-    
-    .option-button[data-streamlit-key="Skip Image"] .number-badge {
-        background-color: #fff0f0;
-        border-color: #ffcccc;
-        color: #cc0000;
-    }
-    
-    .option-button[data-streamlit-key="Skip Image"]:hover {
-        background-color: #ffd9d9;
-        border-color: #ffb3b3;
-    }
-    
-    .option-button[data-streamlit-key="Skip Image"]:hover .number-badge {
-        background-color: #ffe6e6;
-        border-color: #ffb3b3;
-    }
-    
-    .option-button:hover {
-        background-color: #e9ecef;
-        border-color: #ced4da;
-        transform: translateY(-1px);
-        box-shadow: 0 2px 4px rgba(0,0,0,0.05);
-    }
-
-    .option-button:active {
-        background-color: #e9ecef;
-        transform: translateY(0);
-        box-shadow: none;
-    }
-    
-    /* Add styles for the clicked state */
-    .option-button[data-clicked="true"] {
-        background-color: #e9ecef;
-        border-color: #ced4da;
-        box-shadow: inset 0 1px 2px rgba(0,0,0,0.1);
-    }
-    
-    /* Number badges */
-    span.number-badge {
-        display: inline-flex;
-        align-items: center;
-        justify-content: center;
-        background-color: white;
-        color: #666;
-        border: 1px solid #dee2e6;
-        border-radius: 50%;
-        width: 1.8em;
-        height: 1.8em;
-        margin-right: 0.75rem;
-        font-size: 0.9em;
-        flex-shrink: 0;
-        font-weight: 500;
-    }
-</style>
-""", unsafe_allow_html=True)
+st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
+
+def encode_json(data, pretty=False):
+    """Serialize data to a JSON string, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 if pretty else 0).decode('utf-8')
+    return json.dumps(data, indent=2 if pretty else None)
+
+def decode_json(content):
+    """Parse a JSON string, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+def file_signature(path):
+    """Get the (mtime, size) of a file or directory, None if it doesn't exist"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+def typing_results_signature():
+    """Get the signatures of the files the typing results are loaded from"""
+    return (file_signature(TYPING_RESULTS_FILE), file_signature(TYPING_JOURNAL_FILE))
 
 def load_typing_results():
-    """Load typing results from JSON file"""
-    if os.path.exists(TYPING_RESULTS_FILE):
-        try:
-            with open(TYPING_RESULTS_FILE, 'r') as f:
-                content = f.read().strip()
-                if content:
-                    return json.loads(content)
-        except json.JSONDecodeError:
-            pass
-    return {}
+    """Load typing results, cached while the files are unchanged (shared dict, copy before mutating)"""
+    return _load_typing_results_cached(*typing_results_signature())
+
+@st.cache_resource(show_spinner=False)
+def _load_typing_results_cached(results_signature, journal_signature):
+    """Load typing results from JSON file and replay the journal on top"""
+    data = {}
+    try:
+        with open(TYPING_RESULTS_FILE, 'r', encoding='utf-8') as f:
+            content = f.read().strip()
+            if content:
+                data = decode_json(content)
+    except (FileNotFoundError, json.JSONDecodeError, UnicodeDecodeError):
+        pass
+    
+    journal_entries = 0
+    try:
+        # Read bytes so a line cut off inside a UTF-8 character only fails to parse on its own
+        with open(TYPING_JOURNAL_FILE, 'rb') as f:
+            for line in f:
+                try:
+                    entry = decode_json(line)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    # Skip a partially written line, e.g. after a crash
+                    continue
+                if not isinstance(entry, dict) or 'filename' not in entry or 'results' not in entry:
+                    continue
+                journal_entries += 1
+                if entry['results'] is None:
+                    data.pop(entry['filename'], None)
+                else:
+                    data[entry['filename']] = entry['results']
+    except FileNotFoundError:
+        pass
+    
+    if journal_entries >= JOURNAL_COMPACT_THRESHOLD:
+        compact_typing_results(data, journal_signature)
+    return data
+
+@st.cache_resource
+def get_results_lock():
+    """Get the lock shared by all sessions for writing the results files"""
+    return threading.Lock()
+
+def compact_typing_results(data, journal_signature):
+    """Atomically write the merged results to the JSON file and empty the journal"""
+    with get_results_lock():
+        if file_signature(TYPING_JOURNAL_FILE) != journal_signature:
+            # Another session appended since the journal was read, compact on a later load
+            return
+        tmp_path = TYPING_RESULTS_FILE + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(encode_json(data, pretty=True))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, TYPING_RESULTS_FILE)
+        os.remove(TYPING_JOURNAL_FILE)
+
+def append_typing_journal(changes):
+    """Append changes to the journal in a single write, None results mark a deletion"""
+    lines = ''.join(
+        encode_json({'filename': filename, 'results': results}) + '\n'
+        for filename, results in changes.items()
+    )
+    with get_results_lock():
+        with open(TYPING_JOURNAL_FILE, 'ab+') as f:
+            # Cut off a partial last line from an interrupted write, so it can't swallow the new entries
+            end = f.seek(0, os.SEEK_END)
+            if end:
+                f.seek(end - 1)
+                if f.read(1) != b'\n':
+                    f.seek(0)
+                    f.truncate(f.read().rfind(b'\n') + 1)
+            f.write(lines.encode('utf-8'))
+    _load_typing_results_cached.clear()
+    sorted_typed_filenames.clear()
+    typed_filter_index.clear()
+    formatted_typed_dates.clear()
+    export_typing_results.clear()
+    _untyped_files_cached.clear()
+
+def same_results(stored, results):
+    """Check if results match the stored results, ignoring when they were typed"""
+    if stored is None:
+        return False
+    return ({k: v for k, v in stored.items() if k != 'typed_date'} ==
+            {k: v for k, v in results.items() if k != 'typed_date'})
+
+def save_typing_results(results_by_file):
+    """Save typing results for several files at once, skipping unchanged ones"""
+    typed = load_typing_results()
+    changes = {filename: results for filename, results in results_by_file.items()
+               if not same_results(typed.get(filename), results)}
+    if not changes:
+        return
+    # Add typing date to results
+    typed_date = datetime.datetime.now().isoformat()
+    for results in changes.values():
+        results['typed_date'] = typed_date
+    append_typing_journal(changes)
 
 def save_typing_result(filename, results):
     """Save typing results for a file"""
-    data = load_typing_results()
-    # Add typing date to results
-    results['typed_date'] = datetime.datetime.now().isoformat()
-    data[filename] = results
-    with open(TYPING_RESULTS_FILE, 'w') as f:
-        json.dump(data, f, indent=4)
+    save_typing_results({filename: results})
+
+def delete_typing_result(filename):
+    """Delete typing results for a file"""
+    if filename in load_typing_results():
+        append_typing_journal({filename: None})
+
+@st.cache_resource
+def ensure_images_dir():
+    """Create the images directory once per process instead of checking every rerun"""
+    os.makedirs(DEFAULT_IMAGES_DIR, exist_ok=True)
+    return True
 
 def get_untyped_files():
     """Get list of untyped SVG files"""
-    if not os.path.exists(DEFAULT_IMAGES_DIR):
-        os.makedirs(DEFAULT_IMAGES_DIR)
-    
-    typed = load_typing_results()
-    all_files = [f for f in os.listdir(DEFAULT_IMAGES_DIR) if f.lower().endswith('.svg')]
-    return [f for f in all_files if f not in typed]
+    ensure_images_dir()
+    return _untyped_files_cached(file_signature(DEFAULT_IMAGES_DIR), typing_results_signature())
+
+@st.cache_resource(show_spinner=False)
+def _untyped_files_cached(directory_signature, results_signature):
+    """Diff the SVG listing against the typed files, cached until either changes"""
+    typed = _load_typing_results_cached(*results_signature)
+    all_files = _list_svg_files(DEFAULT_IMAGES_DIR, directory_signature)
+    return tuple(f for f in all_files if f not in typed)
+
+@st.cache_resource(show_spinner=False)
+def _list_svg_files(directory, directory_signature):
+    """List the SVG files in a directory, cached until the directory changes"""
+    with os.scandir(directory) as entries:
+        return tuple(entry.name for entry in entries if entry.is_file() and entry.name.lower().endswith('.svg'))
+
+# Cached by Streamlit rather than lru_cache, which this script would recreate empty on every rerun
+@st.cache_data(max_entries=128, show_spinner=False)
+def _svg_image_cached(path, signature):
+    """Read an SVG file and encode it as a data URL, cached until the file changes"""
+    with open(path, 'r') as f:
+        svg_content = f.read()
+    if "xmlns" not in svg_content:
+        # The xmlns attribute is required for SVGs to render in an img tag
+        svg_content = svg_content.replace("<svg", '<svg xmlns="http://www.w3.org/2000/svg" ', 1)
+    return "data:image/svg+xml;base64," + base64.b64encode(svg_content.encode('utf-8')).decode('ascii')
+
+def svg_image(path):
+    """Get an SVG file as a data URL that st.image shows without re-encoding"""
+    return _svg_image_cached(path, file_signature(path))
+
+@st.cache_resource
+def get_prefetch_executor():
+    """Get the thread pool shared by all sessions for reading files ahead"""
+    return ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1))
+
+def prefetch_svgs(files, current_index):
+    """Read the files after the current one in the background, so svg_image finds them cached"""
+    executor = get_prefetch_executor()
+    for filename in files[current_index + 1:current_index + 1 + PREFETCH_COUNT]:
+        executor.submit(svg_image, os.path.join(DEFAULT_IMAGES_DIR, filename))
+
+def reset_typing_state():
+    """Forget the answers given so far and go back to the first step"""
+    st.session_state.current_results = {}
+    st.session_state.current_step = 'basic_shape'
+    st.session_state.pop('current_cutout', None)
+
+def finish_typing(filename, drill_holes):
+    """Save the answers for the current file and start over for the next one"""
+    st.session_state.current_results['drill_holes'] = drill_holes
+    save_typing_result(filename, st.session_state.current_results)
+    reset_typing_state()
+    st.success("Typing saved!")
+
+# Button callbacks: Streamlit reruns once after a callback returns, so the
+# handlers only update session state and never call st.rerun() themselves.
+def go_to_file(index):
+    """Move to another file and start typing it from the first step"""
+    st.session_state.current_file_index = index
+    reset_typing_state()
+
+def pick_basic_shape(filename, shape):
+    """Store the basic shape, or save the file as skipped"""
+    if shape == "Skip Image":
+        # Save skipped image result
+        skip_results = {
+            'basic_shape': 'Skip Image',
+            'number_of_cutouts': 'No cutouts',
+            'cutout_count': 0,
+            'drill_holes': 'No',
+            'typed_date': datetime.datetime.now().isoformat()
+        }
+        save_typing_result(filename, skip_results)
+        
+        reset_typing_state()
+        st.success("Image skipped")
+    else:
+        st.session_state.current_results['basic_shape'] = shape
+        st.session_state.current_step = 'number_of_cutouts'
+
+def pick_cutout_count(label, value):
+    """Store the number of cutouts and go to the next step"""
+    st.session_state.current_results['number_of_cutouts'] = label
+    st.session_state.current_results['cutout_count'] = value
+    if value > 0:
+        st.session_state.current_step = 'cutouts'
+        st.session_state.current_cutout = 0
+    else:
+        # No cutouts or multiple/complex cutouts (-1)
+        st.session_state.current_step = 'drill_holes'
+
+def pick_cutout(index, shape):
+    """Store the shape of one cutout and go to the next cutout or step"""
+    st.session_state.current_results[f'cutout_{index}'] = shape
+    if index + 1 < st.session_state.current_results['cutout_count']:
+        st.session_state.current_cutout = index + 1
+    else:
+        st.session_state.current_step = 'drill_holes'
 
-def show_typing_interface():
+def show_typing_interface(untyped_files):
     """Show the main typing interface"""
     # Get untyped files or the file being edited
-    if hasattr(st.session_state, 'editing_file'):
+    if 'editing_file' in st.session_state:
         files = [st.session_state.editing_file]
         is_editing = True
     else:
-        files = get_untyped_files()
+        files = untyped_files
         is_editing = False
 
     if not files:
@@ -257,18 +315,12 @@ def show_typing_interface():
             st.write("Editing mode")
         nav_col1, nav_col2, _ = st.columns([1, 1, 8])
         with nav_col1:
-            if st.button("Previous", disabled=st.session_state.current_file_index == 0, key="prev_btn"):
-                st.session_state.current_file_index = max(0, st.session_state.current_file_index - 1)
-                st.session_state.current_results = {}
-                st.session_state.current_step = 'basic_shape'
-                st.rerun()
+            st.button("Previous", disabled=st.session_state.current_file_index == 0, key="prev_btn",
+                      on_click=go_to_file, args=(max(0, st.session_state.current_file_index - 1),))
         
         with nav_col2:
-            if st.button("Next", disabled=st.session_state.current_file_index == len(files) - 1, key="next_btn"):
-                st.session_state.current_file_index = min(len(files) - 1, st.session_state.current_file_index + 1)
-                st.session_state.current_results = {}
-                st.session_state.current_step = 'basic_shape'
-                st.rerun()
+            st.button("Next", disabled=st.session_state.current_file_index == len(files) - 1, key="next_btn",
+                      on_click=go_to_file, args=(min(len(files) - 1, st.session_state.current_file_index + 1),))
         
     with col2:
         if not is_editing:
@@ -283,96 +335,47 @@ def show_typing_interface():
         st.caption(f"Typing: {current_file}")
     
     # Calculate overall progress
-    total_steps = 3  # basic_shape, number_of_cutouts, drill_holes
-    current_progress = 0
-    
-    if 'current_step' in st.session_state:
-        if st.session_state.current_step == 'basic_shape':
-            current_progress = 0
-        elif st.session_state.current_step == 'number_of_cutouts':
-            current_progress = 1
-        elif st.session_state.current_step == 'cutouts':
-            # For cutouts, show partial progress between number_of_cutouts and drill_holes
-            cutout_count = st.session_state.current_results.get('cutout_count', 0)
-            if cutout_count > 0:
-                current_cutout = getattr(st.session_state, 'current_cutout', 0)
-                current_progress = 1 + (current_cutout / cutout_count)
-        elif st.session_state.current_step == 'drill_holes':
-            current_progress = 2
+    current_step = st.session_state.current_step
+    current_progress = STEP_PROGRESS.get(current_step, 0)
+    if current_step == 'cutouts':
+        # For cutouts, show partial progress between number_of_cutouts and drill_holes
+        cutout_count = st.session_state.current_results.get('cutout_count', 0)
+        if cutout_count > 0:
+            current_cutout = st.session_state.get('current_cutout', 0)
+            current_progress += current_cutout / cutout_count
     
     # Show progress bar
-    progress = current_progress / total_steps
+    progress = current_progress / TOTAL_STEPS
     st.progress(progress)
-    st.caption(f"Step {int(current_progress) + 1} of {total_steps}")
+    st.caption(f"Step {int(current_progress) + 1} of {TOTAL_STEPS}")
     
     # Create two columns for image and buttons
     img_col, btn_col = st.columns([2, 1])
     
     # Show image in left column
     with img_col:
-        st.image(filepath)
+        st.image(svg_image(filepath))
+    prefetch_svgs(files, st.session_state.current_file_index)
     
     # Show buttons in right column
     with btn_col:
         # Show current step
         if st.session_state.current_step == 'basic_shape':
             st.subheader("Basic Shape")
-            for i, shape in enumerate(BASIC_SHAPES):
-                st.markdown(f'''
-                    <div class="typing-button-container">
-                        <button class="option-button" data-streamlit-key="{shape}">
-                            <span class="number-badge">{'-' if shape == 'Skip Image' else (i+1 if i < 9 else 0)}</span>{shape}
-                        </button>
-                    </div>
-                ''', unsafe_allow_html=True)
-                if st.button("", key=shape):
-                    if shape == "Skip Image":
-                        # Save skipped image result
-                        skip_results = {
-                            'basic_shape': 'Skip Image',
-                            'number_of_cutouts': 'No cutouts',
-                            'cutout_count': 0,
-                            'drill_holes': 'No',
-                            'typed_date': datetime.datetime.now().isoformat()
-                        }
-                        # Save the result
-                        save_typing_result(current_file, skip_results)
-                        
-                        # Reset the current results and step
-                        st.session_state.current_results = {}
-                        st.session_state.current_step = 'basic_shape'
-                        st.success("Image skipped")
-                        st.rerun()
-                    else:
-                        st.session_state.current_results['basic_shape'] = shape
-                        st.session_state.current_step = 'number_of_cutouts'
-                        st.rerun()
+            for shape, html in zip(BASIC_SHAPES, BASIC_SHAPE_HTML):
+                st.markdown(html, unsafe_allow_html=True)
+                st.button("", key=f"type_basic_shape_{shape}", on_click=pick_basic_shape, args=(current_file, shape))
         
         elif st.session_state.current_step == 'number_of_cutouts':
             st.subheader("Number of Cutouts")
-            for i, count_opt in enumerate(CUTOUT_COUNTS):
-                st.markdown(f'''
-                    <div class="typing-button-container">
-                        <button class="option-button" data-streamlit-key="{count_opt["label"]}">
-                            <span class="number-badge">{(i+1)%10}</span>{count_opt["label"]}
-                        </button>
-                    </div>
-                ''', unsafe_allow_html=True)
-                if st.button("", key=count_opt["label"]):
-                    st.session_state.current_results['number_of_cutouts'] = count_opt['label']
-                    st.session_state.current_results['cutout_count'] = count_opt['value']
-                    if count_opt['value'] == -1:  # Multiple/complex cutouts
-                        st.session_state.current_step = 'drill_holes'
-                    elif count_opt['value'] > 0:
-                        st.session_state.current_step = 'cutouts'
-                        st.session_state.current_cutout = 0
-                    else:
-                        st.session_state.current_step = 'drill_holes'
-                    st.rerun()
+            for count_opt, html in zip(CUTOUT_COUNTS, CUTOUT_COUNT_HTML):
+                st.markdown(html, unsafe_allow_html=True)
+                st.button("", key=f"type_number_of_cutouts_{count_opt['label']}", on_click=pick_cutout_count,
+                          args=(count_opt["label"], count_opt["value"]))
         
         elif st.session_state.current_step == 'cutouts':
             cutout_count = st.session_state.current_results['cutout_count']
-            current_cutout = getattr(st.session_state, 'current_cutout', 0)
+            current_cutout = st.session_state.get('current_cutout', 0)
             
             # Show progress
             progress = current_cutout / cutout_count
@@ -381,148 +384,171 @@ def show_typing_interface():
             
             # Show cutout selection
             st.subheader(f"Cutout {current_cutout + 1}")
-            for i, shape in enumerate(CUTOUT_SHAPES):
-                st.markdown(f'''
-                    <div class="typing-button-container">
-                        <button class="option-button" data-streamlit-key="{shape}">
-                            <span class="number-badge">{(i+1)%10}</span>{shape}
-                        </button>
-                    </div>
-                ''', unsafe_allow_html=True)
-                if st.button("", key=shape):
-                    st.session_state.current_results[f'cutout_{current_cutout}'] = shape
-                    if current_cutout + 1 < cutout_count:
-                        st.session_state.current_cutout = current_cutout + 1
-                    else:
-                        st.session_state.current_step = 'drill_holes'
-                    st.rerun()
+            for shape, html in zip(CUTOUT_SHAPES, CUTOUT_SHAPE_HTML):
+                st.markdown(html, unsafe_allow_html=True)
+                st.button("", key=f"type_cutout_{shape}", on_click=pick_cutout, args=(current_cutout, shape))
         
         elif st.session_state.current_step == 'drill_holes':
             st.subheader("Drill Holes")
-            st.markdown(f'''
-                <div class="typing-button-container">
-                    <button class="option-button" data-streamlit-key="drill_no">
-                        <span class="number-badge">1</span>No
-                    </button>
-                </div>
-            ''', unsafe_allow_html=True)
-            if st.button("", key="drill_no"):
-                st.session_state.current_results['drill_holes'] = "No"
-                save_typing_result(current_file, st.session_state.current_results)
-                st.session_state.current_results = {}
-                st.session_state.current_step = 'basic_shape'
-                if hasattr(st.session_state, 'current_cutout'):
-                    delattr(st.session_state, 'current_cutout')
-                st.success("Typing saved!")
-                st.rerun()
-            
-            st.markdown(f'''
-                <div class="typing-button-container">
-                    <button class="option-button" data-streamlit-key="drill_yes">
-                        <span class="number-badge">2</span>Yes
-                    </button>
-                </div>
-            ''', unsafe_allow_html=True)
-            if st.button("", key="drill_yes"):
-                st.session_state.current_results['drill_holes'] = "Yes"
-                save_typing_result(current_file, st.session_state.current_results)
-                st.session_state.current_results = {}
-                st.session_state.current_step = 'basic_shape'
-                if hasattr(st.session_state, 'current_cutout'):
-                    delattr(st.session_state, 'current_cutout')
-                st.success("Typing saved!")
-                st.rerun()
+            for (key, drill_holes), html in zip(DRILL_HOLE_OPTIONS, DRILL_HOLE_HTML):
+                st.markdown(html, unsafe_allow_html=True)
+                st.button("", key=key, on_click=finish_typing, args=(current_file, drill_holes))
     
-    # Update keyboard shortcuts and click handlers
-    components.html(
-        '''
-        <script>
-        function triggerStreamlitButton(key) {
-            const buttons = Array.from(window.parent.document.querySelectorAll('button[data-testid^="baseButton-"]'));
-            const hiddenButton = buttons.find(btn => {
-                const container = btn.closest('div[data-testid="element-container"]');
-                return container && container.previousElementSibling && 
-                       container.previousElementSibling.querySelector(`[data-streamlit-key="${key}"]`);
-            });
-            
-            if (hiddenButton) {
-                hiddenButton.click();
-            }
-        }
+    # Keyboard shortcuts and click handlers
+    components.html(KEYBOARD_SCRIPT, height=0)
 
-        function handleKeyPress(event) {
-            const buttons = Array.from(window.parent.document.querySelectorAll('.typing-button-container .option-button'));
-            
-            if (event.key === '-') {
-                // Find the Skip Image button (last button)
-                const skipButton = buttons[buttons.length - 1];
-                if (skipButton) {
-                    const key = skipButton.getAttribute('data-streamlit-key');
-                    if (key) {
-                        triggerStreamlitButton(key);
-                    }
-                }
-            } else if (event.key >= '0' && event.key <= '9') {
-                // For '0', use the last button (10th option)
-                const index = event.key === '0' ? 9 : parseInt(event.key) - 1;
-                if (buttons[index]) {
-                    const key = buttons[index].getAttribute('data-streamlit-key');
-                    if (key) {
-                        triggerStreamlitButton(key);
-                    }
-                }
-            } else if (event.key === 'ArrowLeft' || event.key === 'ArrowRight') {
-                const navButtons = Array.from(window.parent.document.querySelectorAll('button'));
-                const navButton = navButtons.find(btn => 
-                    (event.key === 'ArrowLeft' && btn.textContent.includes('Previous')) ||
-                    (event.key === 'ArrowRight' && btn.textContent.includes('Next'))
-                );
-                
-                if (navButton && !navButton.disabled) {
-                    navButton.click();
-                }
-            }
-        }
-
-        window.parent.document.removeEventListener('keydown', handleKeyPress);
-        window.parent.document.addEventListener('keydown', handleKeyPress);
+def content_hash(data):
+    """Get a hash of file content"""
+    return hashlib.blake2b(data, digest_size=16).digest()
 
-        window.parent.document.querySelectorAll('.typing-button-container .option-button').forEach(button => {
-            button.addEventListener('click', (e) => {
-                e.preventDefault();
-                e.stopPropagation();
-                
-                const key = button.getAttribute('data-streamlit-key');
-                if (key) {
-                    triggerStreamlitButton(key);
-                }
-            });
-        });
-        </script>
-        ''',
-        height=0,
-    )
+def is_same_content(path, uploaded_file):
+    """Check if a file on disk already holds the uploaded content"""
+    try:
+        if os.path.getsize(path) != uploaded_file.size:
+            return False
+        with open(path, 'rb') as f:
+            existing = f.read()
+    except FileNotFoundError:
+        return False
+    return existing == uploaded_file.getbuffer()
 
 def show_upload_interface():
     """Show the upload interface"""
     st.header("Upload Files")
     uploaded_files = st.file_uploader("Upload SVG files", type=['svg'], accept_multiple_files=True)
     if uploaded_files:
+        saved_count = 0
         for uploaded_file in uploaded_files:
             save_path = os.path.join(DEFAULT_IMAGES_DIR, uploaded_file.name)
-            with open(save_path, 'wb') as f:
-                f.write(uploaded_file.getvalue())
-        st.success(f"{len(uploaded_files)} file(s) uploaded to {DEFAULT_IMAGES_DIR}")
-        st.rerun()
+            # Skip files that are already stored with identical content
+            if is_same_content(save_path, uploaded_file):
+                continue
+            uploaded_file.seek(0)
+            # Write next to the target and swap it in, so other sessions never list a half-written file
+            tmp_path = save_path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                shutil.copyfileobj(uploaded_file, f, length=1024 * 1024)
+            os.replace(tmp_path, save_path)
+            saved_count += 1
+        if saved_count:
+            _list_svg_files.clear()
+            _untyped_files_cached.clear()
+            st.success(f"{saved_count} file(s) uploaded to {DEFAULT_IMAGES_DIR}")
+            st.rerun()
+
+def prepare_export(signature):
+    """Offer the export of the results as they are now, until they change"""
+    st.session_state.export_signature = signature
+
+@st.cache_resource(show_spinner=False)
+def export_typing_results(signature):
+    """Get all typing results as one JSON document, cached until the results change"""
+    return encode_json(_load_typing_results_cached(*signature), pretty=True)
 
-def show_results_interface():
+@st.cache_resource(show_spinner=False)
+def sorted_typed_filenames(signature, sort_by):
+    """Get the typed filenames in display order, cached until the results change"""
+    typed = _load_typing_results_cached(*signature)
+    # Default date for old entries
+    typed_date = lambda filename: typed[filename].get('typed_date', '1970-01-01T00:00:00')
+    if sort_by == 'Filename (Z-A)':
+        order = sorted(typed, reverse=True)
+    elif sort_by == 'Last Typed Date':
+        order = sorted(typed, key=typed_date, reverse=True)
+    elif sort_by == 'First Typed Date':
+        order = sorted(typed, key=typed_date)
+    else:
+        order = sorted(typed)
+    return tuple(order)
+
+@st.cache_resource(show_spinner=False)
+def typed_filter_index(signature):
+    """Index the typed filenames by filter value, cached until the results change"""
+    typed = _load_typing_results_cached(*signature)
+    by_value = {field: {} for field in FILTER_FIELDS.values()}
+    for filename, results in typed.items():
+        for field, filenames in by_value.items():
+            filenames.setdefault(results.get(field), set()).add(filename)
+    lowercase_names = {filename: filename.lower() for filename in typed}
+    return by_value, lowercase_names
+
+def format_typed_date(results):
+    """Format the typing date of a result for display"""
+    typed_date = results.get('typed_date', 'Unknown date')
+    if typed_date != 'Unknown date':
+        try:
+            date_obj = datetime.datetime.fromisoformat(typed_date)
+            typed_date = date_obj.strftime("%Y-%m-%d %H:%M:%S")
+        except:
+            pass
+    return typed_date
+
+@st.cache_resource(show_spinner=False)
+def formatted_typed_dates(signature):
+    """Format the typing date of every result once, cached until the results change"""
+    typed = _load_typing_results_cached(*signature)
+    return {filename: format_typed_date(results) for filename, results in typed.items()}
+
+def show_results_table(items):
+    """Show typed files as one editable table and save only the changed rows"""
+    rows = [{
+        'filename': item['filename'],
+        'basic_shape': item['results'].get('basic_shape'),
+        'number_of_cutouts': item['results'].get('number_of_cutouts'),
+        'drill_holes': item['results'].get('drill_holes'),
+        'typed_date': item['typed_date']
+    } for item in items]
+    
+    edited_rows = st.data_editor(
+        rows,
+        column_config={
+            'filename': st.column_config.TextColumn("Filename"),
+            'basic_shape': st.column_config.SelectboxColumn("Basic Shape", options=BASIC_SHAPES, required=True),
+            # Changing the count also adds or removes cutout shapes, which only the details form asks for
+            'number_of_cutouts': st.column_config.TextColumn("Number of Cutouts"),
+            'drill_holes': st.column_config.SelectboxColumn("Drill Holes", options=["No", "Yes"], required=True),
+            'typed_date': st.column_config.TextColumn("Typed")
+        },
+        disabled=['filename', 'number_of_cutouts', 'typed_date'],
+        hide_index=True,
+        use_container_width=True,
+        # Edits are stored per row position, so each set of rows gets its own editor state
+        key="results_table_" + content_hash('\n'.join(row['filename'] for row in rows).encode('utf-8')).hex()
+    )
+    
+    updates = {}
+    for item, row, edited_row in zip(items, rows, edited_rows):
+        changes = {field: edited_row[field] for field in ('basic_shape', 'drill_holes')
+                   if edited_row[field] != row[field]}
+        if not changes:
+            continue
+        updated_results = item['results'].copy()
+        updated_results.update(changes)
+        updates[item['filename']] = updated_results
+    if updates:
+        save_typing_results(updates)
+        st.success(f"Changes saved for {len(updates)} file(s)!")
+
+def show_results_interface(typed):
     """Show the results interface"""
     st.header("Typed Images")
-    typed = load_typing_results()
     if not typed:
         st.info("No files typed yet")
         return
     
+    # The results file can lag behind the journal, so export the merged results
+    # Only build and register the download on request, a download button re-sends its data on every rerun
+    signature = typing_results_signature()
+    if st.session_state.get('export_signature') == signature:
+        st.download_button(
+            "⬇️ Export JSON",
+            export_typing_results(signature),
+            file_name=TYPING_RESULTS_FILE,
+            mime="application/json"
+        )
+    else:
+        st.button("Prepare export", on_click=prepare_export, args=(signature,))
+    
     # Add search and filter controls
     col1, col2, col3 = st.columns([2, 2, 1])
     
@@ -534,7 +560,7 @@ def show_results_interface():
     with col2:
         filter_options = {
             'Basic Shape': BASIC_SHAPES,
-            'Number of Cutouts': [opt["label"] for opt in CUTOUT_COUNTS],
+            'Number of Cutouts': CUTOUT_COUNT_LABELS,
             'Drill Holes': ['Yes', 'No']
         }
         selected_filter = st.selectbox("Filter by", ['None'] + list(filter_options.keys()))
@@ -545,61 +571,56 @@ def show_results_interface():
     with col3:
         sort_by = st.selectbox("Sort by", ['Filename (A-Z)', 'Filename (Z-A)', 'Last Typed Date', 'First Typed Date'])
     
-    # Filter and sort results
-    filtered_items = []
-    for filename, results in typed.items():
-        # Apply filename search
-        if search_query and search_query.lower() not in filename.lower():
-            continue
-        
-        # Apply type filter
-        if selected_filter != 'None':
-            if selected_filter == 'Basic Shape' and results.get('basic_shape') != filter_value:
-                continue
-            elif selected_filter == 'Number of Cutouts' and results.get('number_of_cutouts') != filter_value:
-                continue
-            elif selected_filter == 'Drill Holes' and results.get('drill_holes') != filter_value:
-                continue
-        
-        # Add to filtered list with metadata
-        filtered_items.append({
-            'filename': filename,
-            'results': results,
-            'typed_date': results.get('typed_date', '1970-01-01T00:00:00')  # Default date for old entries
-        })
-    
-    # Sort items
-    if sort_by == 'Filename (A-Z)':
-        filtered_items.sort(key=lambda x: x['filename'])
-    elif sort_by == 'Filename (Z-A)':
-        filtered_items.sort(key=lambda x: x['filename'], reverse=True)
-    elif sort_by == 'Last Typed Date':
-        filtered_items.sort(key=lambda x: x['typed_date'], reverse=True)
-    elif sort_by == 'First Typed Date':
-        filtered_items.sort(key=lambda x: x['typed_date'])
+    # Filter the cached sort order with set lookups, so no sort is needed
+    signature = typing_results_signature()
+    by_value, lowercase_names = typed_filter_index(signature)
+    filenames = sorted_typed_filenames(signature, sort_by)
+    if selected_filter != 'None':
+        matches = by_value[FILTER_FIELDS[selected_filter]].get(filter_value, set())
+        filenames = [filename for filename in filenames if filename in matches]
+    if search_query:
+        query = search_query.lower()
+        filenames = [filename for filename in filenames if query in lowercase_names[filename]]
+    
+    # Only build and render the current page of results
+    page_count = max(1, -(-len(filenames) // RESULTS_PAGE_SIZE))
+    page = 1
+    if page_count > 1:
+        page = st.number_input("Page", min_value=1, max_value=page_count, value=1, step=1, key="results_page")
+    typed_dates = formatted_typed_dates(signature)
+    page_items = [{
+        'filename': filename,
+        'results': typed[filename],
+        'typed_date': typed_dates[filename]
+    } for filename in filenames[(page - 1) * RESULTS_PAGE_SIZE:page * RESULTS_PAGE_SIZE] if filename in typed]
     
     # Show results count
-    st.caption(f"Showing {len(filtered_items)} of {len(typed)} items")
+    st.caption(f"Showing {len(page_items)} of {len(filenames)} matching items ({len(typed)} total)")
+    
+    # The table edits a whole page with a single widget, details show one form per file
+    view = st.radio("View", ['Details', 'Table'], horizontal=True, key="results_view")
+    if view == 'Table':
+        show_results_table(page_items)
+        return
     
     # Display filtered and sorted results
-    for item in filtered_items:
+    for item in page_items:
         filename = item['filename']
         results = item['results']
-        
-        # Format the typing date for display
-        typed_date = results.get('typed_date', 'Unknown date')
-        if typed_date != 'Unknown date':
-            try:
-                date_obj = datetime.datetime.fromisoformat(typed_date)
-                typed_date = date_obj.strftime("%Y-%m-%d %H:%M:%S")
-            except:
-                pass
+        typed_date = item['typed_date']
         
         with st.expander(f"{filename} (Typed: {typed_date})"):
+            # Collapsed expanders still receive their contents, so only build the form on request
+            if not st.toggle("Edit", key=f"open_{filename}"):
+                continue
             filepath = os.path.join(DEFAULT_IMAGES_DIR, filename)
-            if os.path.exists(filepath):
+            try:
+                image_url = svg_image(filepath)
+            except FileNotFoundError:
+                image_url = None
+            if image_url is not None:
                 col1, col2 = st.columns([1, 3])
-                col1.image(filepath, width=100)
+                col1.image(image_url, width=100)
                 
                 # Show editable results
                 edited = False
@@ -610,7 +631,7 @@ def show_results_interface():
                 new_shape = col2.selectbox(
                     "Basic Shape",
                     BASIC_SHAPES,
-                    index=BASIC_SHAPES.index(current_shape) if current_shape in BASIC_SHAPES else 0,
+                    index=BASIC_SHAPE_INDEX.get(current_shape, 0),
                     key=f"basic_shape_{filename}"
                 )
                 if new_shape != current_shape:
@@ -619,20 +640,16 @@ def show_results_interface():
                 
                 # Number of Cutouts
                 current_cutouts = results.get('number_of_cutouts', '')
-                cutout_options = [opt["label"] for opt in CUTOUT_COUNTS]
                 new_cutouts = col2.selectbox(
                     "Number of Cutouts",
-                    cutout_options,
-                    index=cutout_options.index(current_cutouts) if current_cutouts in cutout_options else 0,
+                    CUTOUT_COUNT_LABELS,
+                    index=CUTOUT_COUNT_INDEX.get(current_cutouts, 0),
                     key=f"cutouts_{filename}"
                 )
                 if new_cutouts != current_cutouts:
                     updated_results['number_of_cutouts'] = new_cutouts
                     # Update the cutout count value
-                    for opt in CUTOUT_COUNTS:
-                        if opt["label"] == new_cutouts:
-                            updated_results['cutout_count'] = opt["value"]
-                            break
+                    updated_results['cutout_count'] = CUTOUT_COUNT_VALUES[new_cutouts]
                     edited = True
                 
                 # Individual Cutouts
@@ -642,7 +659,7 @@ def show_results_interface():
                     new_cutout = col2.selectbox(
                         f"Cutout {i+1}",
                         CUTOUT_SHAPES,
-                        index=CUTOUT_SHAPES.index(current_cutout) if current_cutout in CUTOUT_SHAPES else 0,
+                        index=CUTOUT_SHAPE_INDEX.get(current_cutout, 0),
                         key=f"cutout_{i}_{filename}"
                     )
                     if new_cutout != current_cutout:
@@ -668,15 +685,15 @@ def show_results_interface():
                 
                 # Delete button
                 if col2.button("🗑️ Delete", key=f"delete_{filename}"):
-                    del typed[filename]
-                    with open(TYPING_RESULTS_FILE, 'w') as f:
-                        json.dump(typed, f, indent=4)
+                    delete_typing_result(filename)
                     st.rerun()
 
 def main():
-    # Get file counts
-    untyped_count = len(get_untyped_files())
-    typed_count = len(load_typing_results())
+    # Load the results once and share them with all tabs
+    typed = load_typing_results()
+    untyped_files = get_untyped_files()
+    untyped_count = len(untyped_files)
+    typed_count = len(typed)
     
     # Create tabs
     tab1, tab2, tab3 = st.tabs([
@@ -686,11 +703,11 @@ def main():
     ])
     
     with tab1:
-        show_typing_interface()
+        show_typing_interface(untyped_files)
     with tab2:
         show_upload_interface()
     with tab3:
-        show_results_interface()
+        show_results_interface(typed)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,320 @@
+# Fixed options
+BASIC_SHAPES = [
+    "Rectangle",
+    "Circle",
+    "Rounded Rectangle",
+    "Arched Rectangle",
+    "Sloped Rectangle",
+    "Trapezoid",
+    "Right Angled Triangle",
+    "Ellipse",
+    "Text",
+    "Other Shape",
+    "Skip Image"  # Moved to end of list
+]
+
+CUTOUT_SHAPES = [
+    "Rectangle",
+    "Circle",
+    "Rounded Rectangle",
+    "Arched Rectangle",
+    "Sloped Rectangle",
+    "Trapezoid",
+    "Right Angled Triangle",
+    "Ellipse",
+    "Text",
+    "Other Shape"
+]
+
+DRILL_HOLE_OPTIONS = [("drill_no", "No"), ("drill_yes", "Yes")]  # (button key, value)
+
+CUTOUT_COUNTS = [
+    {"label": "No cutouts", "value": 0},
+    {"label": "1 cutout", "value": 1},
+    {"label": "2 cutouts", "value": 2},
+    {"label": "3 cutouts", "value": 3},
+    {"label": "Multiple/complex cutouts", "value": -1}  # Special value for complex cutouts
+]
+
+# Progress index of each typing step, cutouts are shown between number_of_cutouts and drill_holes
+STEP_PROGRESS = {'basic_shape': 0, 'number_of_cutouts': 1, 'cutouts': 1, 'drill_holes': 2}
+TOTAL_STEPS = 3  # basic_shape, number_of_cutouts, drill_holes
+
+# Lookup tables derived from the fixed options
+CUTOUT_COUNT_LABELS = [opt["label"] for opt in CUTOUT_COUNTS]
+CUTOUT_COUNT_VALUES = {opt["label"]: opt["value"] for opt in CUTOUT_COUNTS}
+BASIC_SHAPE_INDEX = {shape: i for i, shape in enumerate(BASIC_SHAPES)}
+CUTOUT_SHAPE_INDEX = {shape: i for i, shape in enumerate(CUTOUT_SHAPES)}
+CUTOUT_COUNT_INDEX = {label: i for i, label in enumerate(CUTOUT_COUNT_LABELS)}
+
+# Result field each filter of the results tab matches on
+FILTER_FIELDS = {'Basic Shape': 'basic_shape', 'Number of Cutouts': 'number_of_cutouts', 'Drill Holes': 'drill_holes'}
+
+def option_button_html(key, badge, label):
+    """Render the HTML of an option button, the badge shows its keyboard shortcut"""
+    return (f'<div class="typing-button-container"><button class="option-button" data-streamlit-key="{key}">'
+            f'<span class="number-badge">{badge}</span>{label}</button></div>')
+
+# Option button HTML, built once instead of on every rerun
+BASIC_SHAPE_HTML = tuple(
+    option_button_html(shape, '-' if shape == 'Skip Image' else (i + 1) % 10, shape)
+    for i, shape in enumerate(BASIC_SHAPES)
+)
+CUTOUT_COUNT_HTML = tuple(
+    option_button_html(label, (i + 1) % 10, label) for i, label in enumerate(CUTOUT_COUNT_LABELS)
+)
+CUTOUT_SHAPE_HTML = tuple(
+    option_button_html(shape, (i + 1) % 10, shape) for i, shape in enumerate(CUTOUT_SHAPES)
+)
+DRILL_HOLE_HTML = tuple(
+    option_button_html(key, i + 1, value) for i, (key, value) in enumerate(DRILL_HOLE_OPTIONS)
+)
+
+# Custom CSS, emitted at the top of the app on every rerun
+CUSTOM_CSS = """
+<style>
+    /* Navigation container */
+    div[data-testid="column"] > div:has(button:contains("Previous")),
+    div[data-testid="column"] > div:has(button:contains("Next")) {
+        padding: 0 10px;
+    }
+    
+    /* Navigation buttons */
+    div[data-testid="column"] button:contains("Previous"), 
+    div[data-testid="column"] button:contains("Next") {
+        width: 100%;
+        background-color: white;
+        border: 1px solid #ddd;
+        padding: 0.5rem;
+        border-radius: 0.3rem;
+        display: inline-flex !important;
+        align-items: center;
+        justify-content: center;
+    }
+    
+    div[data-testid="column"] button:contains("Previous")::before {
+        content: "←";
+        margin-right: 0.5rem;
+    }
+    
+    div[data-testid="column"] button:contains("Next")::after {
+        content: "→";
+        margin-left: 0.5rem;
+    }
+    
+    /* Image counter */
+    div[data-testid="column"]:has(> div > p:contains("Image")) {
+        text-align: right;
+    }
+    
+    div[data-testid="column"] p:contains("Image") {
+        color: #666;
+        margin: 0;
+    }
+    
+    /* Hide default Streamlit buttons */
+    div[data-testid="stVerticalBlock"] > div.element-container:has(.typing-button-container) + div.element-container {
+        display: none !important;
+        position: absolute !important;
+        pointer-events: none !important;
+        opacity: 0 !important;
+        height: 0 !important;
+        width: 0 !important;
+        margin: 0 !important;
+        padding: 0 !important;
+        overflow: hidden !important;
+    }
+    
+    /* Position typing buttons */
+    .typing-button-container {
+        width: 100%;
+        margin-bottom: 10px;
+    }
+    
+    /* Option buttons */
+    .option-button {
+        background-color: #f8f9fa;
+        border: 1px solid #dee2e6;
+        border-radius: 0.5rem;
+        padding: 0.5rem;
+        width: 100%;
+        font-size: 1em;
+        line-height: 1.5;
+        color: #333;
+        transition: all 0.2s;
+        cursor: pointer;
+        text-align: left;
+        display: flex;
+        align-items: center;
+    }
+    
+    /* Special style for Skip Image button */
+    .option-button[data-streamlit-key="Skip Image"] {
+        background-color: #ffe6e6;
+        border-color: #ffcccc;
+    }
+    
+    .option-button[data-streamlit-key="Skip Image"] .number-badge {
+        background-color: #fff0f0;
+        border-color: #ffcccc;
+        color: #cc0000;
+    }
+    
+    .option-button[data-streamlit-key="Skip Image"]:hover {
+        background-color: #ffd9d9;
+        border-color: #ffb3b3;
+    }
+    
+    .option-button[data-streamlit-key="Skip Image"]:hover .number-badge {
+        background-color: #ffe6e6;
+        border-color: #ffb3b3;
+    }
+    
+    .option-button:hover {
+        background-color: #e9ecef;
+        border-color: #ced4da;
+        transform: translateY(-1px);
+        box-shadow: 0 2px 4px rgba(0,0,0,0.05);
+    }
+
+    .option-button:active {
+        background-color: #e9ecef;
+        transform: translateY(0);
+        box-shadow: none;
+    }
+    
+    /* Add styles for the clicked state */
+    .option-button[data-clicked="true"] {
+        background-color: #e9ecef;
+        border-color: #ced4da;
+        box-shadow: inset 0 1px 2px rgba(0,0,0,0.1);
+    }
+    
+    /* Number badges */
+    span.number-badge {
+        display: inline-flex;
+        align-items: center;
+        justify-content: center;
+        background-color: white;
+        color: #666;
+        border: 1px solid #dee2e6;
+        border-radius: 50%;
+        width: 1.8em;
+        height: 1.8em;
+        margin-right: 0.75rem;
+        font-size: 0.9em;
+        flex-shrink: 0;
+        font-weight: 500;
+    }
+</style>
+"""
+
+# Keyboard shortcuts and click handlers. The handlers are installed once into
+# the parent page so they survive reruns, later reruns only hit the guard.
+KEYBOARD_SCRIPT = '''
+<script>
+if (!window.parent.svgTypingHandlersInstalled) {
+    window.parent.svgTypingHandlersInstalled = true;
+    const script = window.parent.document.createElement('script');
+    script.textContent = `(${installHandlers.toString()})();`;
+    window.parent.document.head.appendChild(script);
+}
+
+function installHandlers() {
+    // Streamlit can't process clicks that arrive faster than it reruns
+    const CLICK_INTERVAL_MS = 200;
+    let lastClick = 0;
+
+    function clickOnce(button) {
+        const now = Date.now();
+        if (now - lastClick < CLICK_INTERVAL_MS) {
+            return;
+        }
+        lastClick = now;
+        button.click();
+    }
+
+    // Option buttons only change when Streamlit updates the page, so look them
+    // up again after the DOM changed instead of on every keypress
+    let optionButtons = null;
+    new MutationObserver(() => { optionButtons = null; })
+        .observe(document.body, {subtree: true, childList: true});
+
+    function getOptionButtons() {
+        if (optionButtons === null) {
+            optionButtons = Array.from(document.querySelectorAll('.typing-button-container .option-button'));
+        }
+        return optionButtons;
+    }
+
+    function triggerStreamlitButton(key) {
+        const buttons = Array.from(document.querySelectorAll('button[data-testid^="baseButton-"]'));
+        const hiddenButton = buttons.find(btn => {
+            const container = btn.closest('div[data-testid="element-container"]');
+            return container && container.previousElementSibling && 
+                   container.previousElementSibling.querySelector(`[data-streamlit-key="${key}"]`);
+        });
+        
+        if (hiddenButton) {
+            clickOnce(hiddenButton);
+        }
+    }
+
+    function handleKeyPress(event) {
+        if (event.repeat) {
+            // Ignore auto-repeat from a held-down key
+            return;
+        }
+        const buttons = getOptionButtons();
+        
+        if (event.key === '-') {
+            // Find the Skip Image button (last button)
+            const skipButton = buttons[buttons.length - 1];
+            if (skipButton) {
+                const key = skipButton.getAttribute('data-streamlit-key');
+                if (key) {
+                    triggerStreamlitButton(key);
+                }
+            }
+        } else if (event.key >= '0' && event.key <= '9') {
+            // For '0', use the last button (10th option)
+            const index = event.key === '0' ? 9 : parseInt(event.key) - 1;
+            if (buttons[index]) {
+                const key = buttons[index].getAttribute('data-streamlit-key');
+                if (key) {
+                    triggerStreamlitButton(key);
+                }
+            }
+        } else if (event.key === 'ArrowLeft' || event.key === 'ArrowRight') {
+            const navButtons = Array.from(document.querySelectorAll('button'));
+            const navButton = navButtons.find(btn => 
+                (event.key === 'ArrowLeft' && btn.textContent.includes('Previous')) ||
+                (event.key === 'ArrowRight' && btn.textContent.includes('Next'))
+            );
+            
+            if (navButton && !navButton.disabled) {
+                clickOnce(navButton);
+            }
+        }
+    }
+
+    function handleClick(event) {
+        // Delegated so option buttons rendered by later reruns are handled too
+        const button = event.target.closest('.typing-button-container .option-button');
+        if (!button) {
+            return;
+        }
+        event.preventDefault();
+        event.stopPropagation();
+        
+        const key = button.getAttribute('data-streamlit-key');
+        if (key) {
+            triggerStreamlitButton(key);
+        }
+    }
+
+    document.addEventListener('keydown', handleKeyPress);
+    document.addEventListener('click', handleClick);
+}
+</script>
+'''
@@ -1,47 +1,68 @@
 import tensorflow as tf
 import numpy as np
-from PIL import Image
-import io
-from cairosvg import svg2png
-import cv2
 import os
+import collections
+import logging
+from functools import cached_property
+# Rasterization lives in its own module so spawned workers don't import TensorFlow
+from rasterize import IMAGE_CACHE_DIR, prune_image_cache, rasterize_svg, rasterize_content, rasterize_file
+from worker_pool import get_worker_pool, chunk_size
+
+logger = logging.getLogger(__name__)
 
 class SVGTypingModel:
-    def __init__(self, typing_steps, image_size=(224, 224)):
+    def __init__(self, typing_steps, image_size=(224, 224), image_cache_dir=IMAGE_CACHE_DIR):
         self.typing_steps = typing_steps
         self.image_size = image_size
+        self.image_cache_dir = image_cache_dir  # None disables the on-disk image cache
+        # Option values of each step in order, and the label index of each value
+        self._sorted_option_values = {
+            step_id: [opt['value'] for opt in sorted(step.options, key=lambda x: x['order'])]
+            for step_id, step in typing_steps.items()
+        }
+        self._option_index = {
+            step_id: {value: i for i, value in enumerate(values)}
+            for step_id, values in self._sorted_option_values.items()
+        }
         self.model = None
+        self._infer = None
+        # Enhanced data augmentation, built here because its random state can't be created inside the tf.data map
+        self._augmentation = tf.keras.Sequential([
+            tf.keras.layers.RandomRotation(0.3),
+            tf.keras.layers.RandomZoom(0.2),
+            tf.keras.layers.RandomTranslation(0.2, 0.2),
+            tf.keras.layers.RandomContrast(0.3)
+        ])
+    
+    @cached_property
+    def sorted_step_items(self):
+        """The (step_id, step) pairs of the typing steps in order, sorted once per model"""
+        return sorted(self.typing_steps.items(), key=lambda x: x[1].order)
     
     def convert_svg_to_image(self, svg_content):
-        """Convert SVG content to a normalized image array"""
-        # Convert SVG to PNG
-        png_data = svg2png(bytestring=svg_content)
-        
-        # Convert PNG to PIL Image
-        image = Image.open(io.BytesIO(png_data))
-        
-        # Convert to RGB (3 channels)
-        image = image.convert('RGB')
-        
-        # Resize to consistent size
-        image = image.resize(self.image_size)
-        
-        # Convert to numpy array and normalize
-        img_array = np.array(image)
-        img_array = img_array.astype('float32') / 255.0
-        
-        return img_array
+        """Convert SVG content to a uint8 RGB image array, the model rescales it to [0, 1]"""
+        return rasterize_svg(svg_content, self.image_size)
     
     def create_model(self):
         """Create the multi-output model using advanced techniques"""
+        # Use float16 compute with float32 weights on GPUs, CPUs have no fast float16 path
+        # The policy is global in Keras, so only hold it while this model is built and compiled
+        previous_policy = tf.keras.mixed_precision.global_policy()
+        if tf.config.list_physical_devices('GPU'):
+            tf.keras.mixed_precision.set_global_policy('mixed_float16')
+        try:
+            return self._build_model()
+        finally:
+            tf.keras.mixed_precision.set_global_policy(previous_policy)
+    
+    def _build_model(self):
+        """Build and compile the model, its layers take the current global dtype policy"""
         # Input layer (3 channels for RGB)
-        inputs = tf.keras.layers.Input(shape=(*self.image_size, 3))
+        inputs = tf.keras.layers.Input(shape=(*self.image_size, 3), dtype='uint8')
         
-        # Enhanced data augmentation
-        x = tf.keras.layers.RandomRotation(0.3)(inputs)
-        x = tf.keras.layers.RandomZoom(0.2)(x)
-        x = tf.keras.layers.RandomTranslation(0.2, 0.2)(x)
-        x = tf.keras.layers.RandomContrast(0.3)(x)
+        # Normalize to [0, 1] inside the model, so images stay uint8 until they reach it
+        # (augmentation runs in the training input pipeline, see _make_dataset)
+        x = tf.keras.layers.Rescaling(1. / 255)(inputs)
         
         # Initial convolution block with stronger regularization
         x = tf.keras.layers.Conv2D(32, 3, padding='same', kernel_regularizer=tf.keras.regularizers.l2(0.01))(x)
@@ -74,8 +95,7 @@ class SVGTypingModel:
         metrics_dict = {}
         loss_weights_dict = {}
         
-        sorted_steps = sorted(self.typing_steps.values(), key=lambda x: x.order)
-        for step in sorted_steps:
+        for _, step in self.sorted_step_items:
             output_name = f'output_{step.id}'
             
             # Specific branch for each output
@@ -88,6 +108,7 @@ class SVGTypingModel:
             output = tf.keras.layers.Dense(
                 len(step.options),
                 activation='softmax',
+                dtype='float32',  # Keep the softmax and loss in float32 for numerical stability
                 name=output_name
             )(branch)
             outputs.append(output)
@@ -100,6 +121,7 @@ class SVGTypingModel:
         
         # Create and compile model with custom optimizer
         self.model = tf.keras.Model(inputs=inputs, outputs=outputs)
+        self._infer = None
         
         # Custom learning rate schedule
         initial_learning_rate = 0.001
@@ -121,31 +143,111 @@ class SVGTypingModel:
         
         return self.model
     
-    def prepare_data(self, typed_files):
-        """Prepare training data from typed files"""
-        X = []  # Images
-        Y = []  # Labels for each step
+    def fold_batch_norm(self):
+        """Build an inference copy of the model with each BatchNormalization folded into the layer before it"""
+        # Find each BatchNormalization's input layer, the output branches are not adjacent in model.layers
+        producers = {id(layer.output): layer for layer in self.model.layers}
+        # Rewriting a producer's weights would also change what its other consumers and model outputs see
+        consumers = collections.Counter(id(output) for output in self.model.outputs)
+        for layer in self.model.layers:
+            inputs = layer.input if isinstance(layer.input, (list, tuple)) else [layer.input]
+            consumers.update(id(tensor) for tensor in inputs)
+        folded = {}
+        for layer in self.model.layers:
+            previous = producers.get(id(layer.input)) if isinstance(layer, tf.keras.layers.BatchNormalization) else None
+            # BN can only be folded through a linear layer, not across its activation
+            if (isinstance(previous, (tf.keras.layers.Conv2D, tf.keras.layers.Dense)) and previous.use_bias
+                    and previous.get_config().get('activation') == 'linear'
+                    and consumers[id(previous.output)] == 1):
+                folded[layer.name] = previous
         
-        # Initialize Y lists for each step
-        for _ in self.typing_steps:
-            Y.append([])
+        # Folded BatchNormalization layers become identities, the other layers are copied as they are
+        inference_model = tf.keras.models.clone_model(
+            self.model,
+            clone_function=lambda layer: (tf.keras.layers.Activation('linear', name=layer.name)
+                                          if layer.name in folded else layer.__class__.from_config(layer.get_config()))
+        )
+        for layer in self.model.layers:
+            if layer.weights and layer.name not in folded:
+                inference_model.get_layer(layer.name).set_weights(layer.get_weights())
         
-        # Process each file
+        # At inference BN is y = gamma * (x - mean) / sqrt(var + eps) + beta, an affine map per channel
+        for bn_name, layer in folded.items():
+            bn = self.model.get_layer(bn_name)
+            kernel, bias = layer.get_weights()
+            scale = 1.0 / np.sqrt(bn.moving_variance.numpy() + bn.epsilon)
+            if bn.gamma is not None:
+                scale = scale * bn.gamma.numpy()
+            shift = -bn.moving_mean.numpy() * scale
+            if bn.beta is not None:
+                shift = shift + bn.beta.numpy()
+            inference_model.get_layer(layer.name).set_weights([kernel * scale, bias * scale + shift])
+        return inference_model
+    
+    def _inference_function(self):
+        """Get the model's forward pass traced as a graph, built once per model"""
+        if self._infer is None:
+            model = self.fold_batch_norm()
+            if model.inputs[0].dtype == tf.uint8:
+                forward = lambda x: model(x, training=False)
+            else:
+                # Models saved before the Rescaling layer was added expect images scaled to [0, 1]
+                forward = lambda x: model(tf.cast(x, tf.float32) / 255.0, training=False)
+            self._infer = tf.function(
+                forward,
+                input_signature=[tf.TensorSpec((None, *self.image_size, 3), tf.uint8)]
+            )
+        return self._infer
+    
+    def _count_examples(self, results):
+        """Count the training examples of a file, one per cutout"""
+        cutout_index = 1
+        while results.get(f"additional_cutout_{cutout_index}") == "Ja":
+            cutout_index += 1
+        return cutout_index
+    
+    def prepare_data(self, typed_files, share_images=False, workers=None):
+        """Prepare training data from typed files, with share_images the examples of a file share one image"""
+        # Count the examples first so the arrays are allocated once instead of stacked from lists
+        example_counts = []
+        valid_files = {}
         for filename, data in typed_files.items():
             try:
-                # Read and convert SVG
-                with open(filename, 'r') as f:
-                    svg_content = f.read()
-                img_array = self.convert_svg_to_image(svg_content)
-                
+                example_counts.append(self._count_examples(data['results']))
+            except Exception as e:
+                logger.error("Error processing %s: %s", filename, e)
+                continue
+            valid_files[filename] = data
+        typed_files = valid_files
+        total = sum(example_counts)
+        X = np.empty((len(typed_files) if share_images else total, *self.image_size, 3), dtype=np.uint8)  # Images
+        image_index = np.empty(total, dtype=np.int64)
+        Y = [np.empty(total, dtype=np.int64) for _ in self.typing_steps]  # Labels for each step
+        
+        if self.image_cache_dir is not None:
+            prune_image_cache(self.image_cache_dir)
+        
+        # Rasterize the files in worker processes, imap hands the images back in file order
+        jobs = [(filename, self.image_size, self.image_cache_dir) for filename in typed_files]
+        pool = get_worker_pool(len(jobs), workers)
+        if pool is not None:
+            images = pool.imap(rasterize_file, jobs, chunksize=chunk_size(len(jobs)))
+        else:
+            images = map(rasterize_file, jobs)
+        
+        # Process each file
+        n = 0
+        file_count = 0
+        for (filename, data), count, (img_array, error) in zip(typed_files.items(), example_counts, images):
+            if error is not None:
+                logger.error("Error processing %s: %s", filename, error)
+                continue
+            try:
                 # For each file, we'll create multiple training examples if there are multiple cutouts
-                cutout_index = 1
-                while True:
-                    X.append(img_array)
-                    
+                labels = [[] for _ in self.typing_steps]
+                for cutout_index in range(1, count + 1):
                     # Process labels for each step
-                    sorted_steps = sorted(self.typing_steps.items(), key=lambda x: x[1].order)
-                    for step_idx, (step_id, step) in enumerate(sorted_steps):
+                    for step_idx, (step_id, step) in enumerate(self.sorted_step_items):
                         if step_id == "cutout":
                             # Get the appropriate cutout value based on index
                             cutout_key = f"cutout_{cutout_index}" if cutout_index > 1 else "cutout"
@@ -159,29 +261,52 @@ class SVGTypingModel:
                             current_value = data['results'].get(step_id, step.options[0]['value'])
                         
                         # Find index of the value in options
-                        option_values = [opt['value'] for opt in sorted(step.options, key=lambda x: x['order'])]
-                        label_idx = option_values.index(current_value)
-                        Y[step_idx].append(label_idx)
-                    
-                    # Check if we should process another cutout
-                    additional_key = f"additional_cutout_{cutout_index}"
-                    if data['results'].get(additional_key) == "Ja":
-                        cutout_index += 1
-                    else:
-                        break
+                        labels[step_idx].append(self._option_index[step_id][current_value])
+                
+                # Only write the file's examples once all its labels are known
+                if share_images:
+                    X[file_count] = img_array
+                    image_index[n:n + count] = file_count
+                else:
+                    X[n:n + count] = img_array
+                for y, step_labels in zip(Y, labels):
+                    y[n:n + count] = step_labels
+                n += count
+                file_count += 1
             
             except Exception as e:
-                print(f"Error processing {filename}: {e}")
+                logger.error("Error processing %s: %s", filename, e)
                 continue
         
-        # Convert to numpy arrays
-        X = np.array(X)
-        Y = [np.array(y) for y in Y]
-        
-        return X, Y
+        # Drop the slots of files that failed, shared images come with the index of each example's image
+        if share_images:
+            return X[:file_count], image_index[:n], [y[:n] for y in Y]
+        return X[:n], [y[:n] for y in Y]
+    
+    def _augment(self, images):
+        """Apply random training augmentation to a batch of uint8 images"""
+        return tf.saturate_cast(self._augmentation(images, training=True), tf.uint8)
     
-    def train(self, X, Y, validation_split=0.2, epochs=100, batch_size=32):
-        """Train the model with enhanced techniques"""
+    def _make_dataset(self, X, Y, batch_size, training, image_index=None):
+        """Build a batched and prefetched input pipeline that gathers each batch's images from X"""
+        X = tf.convert_to_tensor(X)
+        if image_index is None:
+            image_index = np.arange(len(Y[0]))
+        # Only indexes and labels are sliced and shuffled, so the images are never copied into the pipeline
+        dataset = tf.data.Dataset.from_tensor_slices((image_index, tuple(Y)))
+        if training:
+            dataset = dataset.shuffle(len(Y[0]), reshuffle_each_iteration=True)
+        dataset = dataset.batch(batch_size)
+        dataset = dataset.map(lambda index, labels: (tf.gather(X, index), labels),
+                              num_parallel_calls=tf.data.AUTOTUNE)
+        if training:
+            # Augment on the CPU while the model trains on the previous batch
+            dataset = dataset.map(lambda images, labels: (self._augment(images), labels),
+                                  num_parallel_calls=tf.data.AUTOTUNE)
+        return dataset.prefetch(tf.data.AUTOTUNE)
+    
+    def train(self, X, Y, validation_split=0.2, epochs=100, batch_size=32, image_index=None):
+        """Train the model with enhanced techniques, pass image_index for data from prepare_data(share_images=True)"""
         if self.model is None:
             self.create_model()
         
@@ -209,94 +334,147 @@ class SVGTypingModel:
             )
         ]
         
-        # Train with larger batch size
+        # Hold out the last part for validation, like Keras' validation_split does
+        example_count = len(Y[0])
+        batch_size = min(batch_size * 2, example_count)  # Increased batch size
+        split = example_count - int(example_count * validation_split)
+        # Both splits gather from one copy of the images
+        X = tf.constant(X)
+        if image_index is None:
+            image_index = np.arange(example_count)
+        
+        def make_dataset(part, training):
+            labels = [y[part] for y in Y]
+            return self._make_dataset(X, labels, batch_size, training, image_index=image_index[part])
+        
+        train_data = make_dataset(slice(None, split), training=True)
+        validation_data = make_dataset(slice(split, None), training=False) if split < example_count else None
+        
+        # Train on the prefetched pipeline so input preparation overlaps with training steps
         history = self.model.fit(
-            X,
-            Y,
-            validation_split=validation_split,
+            train_data,
+            validation_data=validation_data,
             epochs=epochs,
-            batch_size=min(batch_size * 2, len(X)),  # Increased batch size
             callbacks=callbacks,
             verbose=1
         )
         
         # Load best weights
         self.model.load_weights('best_model.keras')
+        # The folded inference copy holds the old weights, rebuild it on the next prediction
+        self._infer = None
         
         return history
     
+    def _run_model(self, img_batch):
+        """Run the traced model on a uint8 image batch, returns a probability array per step"""
+        predictions = self._inference_function()(tf.constant(img_batch))
+        if not isinstance(predictions, (list, tuple)):
+            # A model with a single output returns a tensor instead of a list
+            predictions = [predictions]
+        return [p.numpy() for p in predictions]
+    
+    def _decode_predictions(self, predictions, sample=0):
+        """Turn the model output for one sample of a batch into typing results"""
+        results = {}
+        cutout_index = 1
+        for step_idx, (step_id, step) in enumerate(self.sorted_step_items):
+            # Get predicted class index
+            pred_probs = predictions[step_idx][sample]
+            pred_idx = np.argmax(pred_probs)
+            
+            # Get corresponding option value
+            selected_value = self._sorted_option_values[step_id][pred_idx]
+            
+            if step_id == "cutout":
+                # For cutouts, use indexed keys
+                cutout_key = f"cutout_{cutout_index}" if cutout_index > 1 else "cutout"
+                results[cutout_key] = selected_value
+                logger.debug("Step %s %d - Predicted %s (confidence: %.2f%%)", step.name, cutout_index, selected_value, pred_probs[pred_idx] * 100)
+            elif step_id == "additional_cutout":
+                # For additional cutout question, use indexed keys
+                additional_key = f"additional_cutout_{cutout_index}"
+                results[additional_key] = selected_value
+                logger.debug("Step %s %d - Predicted %s (confidence: %.2f%%)", step.name, cutout_index, selected_value, pred_probs[pred_idx] * 100)
+                
+                # If we predict another cutout, increment the index
+                if selected_value == "Ja":
+                    cutout_index += 1
+            else:
+                # For other steps, use normal keys
+                results[step_id] = selected_value
+                logger.debug("Step %s - Predicted %s (confidence: %.2f%%)", step.name, selected_value, pred_probs[pred_idx] * 100)
+        
+        return results
+    
     def predict(self, svg_content):
         """Predict typing for a new SVG"""
         if self.model is None:
-            print("Debug: Model not loaded")
+            logger.debug("Model not loaded")
             raise ValueError("Model not trained yet")
         
         try:
             # Convert SVG to image array
-            print("Debug: Converting SVG to image")
+            logger.debug("Converting SVG to image")
             img_array = self.convert_svg_to_image(svg_content)
-            print(f"Debug: Image array shape: {img_array.shape}")
+            logger.debug("Image array shape: %s", img_array.shape)
             
             # Add batch dimension and make prediction
             img_batch = np.expand_dims(img_array, axis=0)
-            print(f"Debug: Batch shape: {img_batch.shape}")
+            logger.debug("Batch shape: %s", img_batch.shape)
             
-            print("Debug: Making prediction")
-            predictions = self.model.predict(img_batch, verbose=0)
-            print(f"Debug: Got {len(predictions)} predictions")
+            logger.debug("Making prediction")
+            predictions = self._run_model(img_batch)
+            logger.debug("Got %d predictions", len(predictions))
             
             # Process predictions
-            results = {}
-            sorted_steps = sorted(self.typing_steps.items(), key=lambda x: x[1].order)
-            
-            cutout_index = 1
-            for step_idx, (step_id, step) in enumerate(sorted_steps):
-                # Get predicted class index
-                pred_probs = predictions[step_idx][0]
-                pred_idx = np.argmax(pred_probs)
-                
-                # Get corresponding option value
-                option_values = [opt['value'] for opt in sorted(step.options, key=lambda x: x['order'])]
-                selected_value = option_values[pred_idx]
-                
-                if step_id == "cutout":
-                    # For cutouts, use indexed keys
-                    cutout_key = f"cutout_{cutout_index}" if cutout_index > 1 else "cutout"
-                    results[cutout_key] = selected_value
-                    print(f"Debug: Step {step.name} {cutout_index} - Predicted {selected_value} (confidence: {pred_probs[pred_idx]:.2%})")
-                elif step_id == "additional_cutout":
-                    # For additional cutout question, use indexed keys
-                    additional_key = f"additional_cutout_{cutout_index}"
-                    results[additional_key] = selected_value
-                    print(f"Debug: Step {step.name} {cutout_index} - Predicted {selected_value} (confidence: {pred_probs[pred_idx]:.2%})")
-                    
-                    # If we predict another cutout, increment the index
-                    if selected_value == "Ja":
-                        cutout_index += 1
-                else:
-                    # For other steps, use normal keys
-                    results[step_id] = selected_value
-                    print(f"Debug: Step {step.name} - Predicted {selected_value} (confidence: {pred_probs[pred_idx]:.2%})")
-            
-            return results
+            return self._decode_predictions(predictions)
             
         except Exception as e:
-            print(f"Error during prediction: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Error during prediction: %s", e)
             return {}  # Return empty dict on error
     
+    def predict_many(self, svg_contents, workers=None):
+        """Predict typing for several SVGs with one model call, an SVG that fails gets an empty dict"""
+        if self.model is None:
+            raise ValueError("Model not trained yet")
+        
+        # Rasterize in worker processes, the model then runs once on the whole batch
+        # New SVGs are usually predicted once, so they are not added to the training image cache
+        jobs = [(svg_content, self.image_size, None) for svg_content in svg_contents]
+        pool = get_worker_pool(len(jobs), workers)
+        if pool is not None:
+            rasterized = pool.map(rasterize_content, jobs, chunksize=chunk_size(len(jobs)))
+        else:
+            rasterized = [rasterize_content(job) for job in jobs]
+        
+        results = [{} for _ in jobs]
+        valid = []
+        for i, (img_array, error) in enumerate(rasterized):
+            if error is None:
+                valid.append(i)
+            else:
+                logger.error("Error during prediction: %s", error)
+        if not valid:
+            return results
+        
+        predictions = self._run_model(np.stack([rasterized[i][0] for i in valid]))
+        for sample, i in enumerate(valid):
+            results[i] = self._decode_predictions(predictions, sample)
+        return results
+    
     def save_model(self, filepath):
         """Save the trained model"""
         if self.model is not None:
             # Remove any extension and add .keras
             filepath = os.path.splitext(filepath)[0] + '.keras'
-            print(f"Debug: Saving model to {filepath}")
+            logger.debug("Saving model to %s", filepath)
             self.model.save(filepath)
-            print("Debug: Model saved successfully")
+            logger.debug("Model saved successfully")
     
     def load_model(self, filepath):
         """Load a trained model"""
-        print(f"Debug: Loading model from {filepath}")
+        logger.debug("Loading model from %s", filepath)
         self.model = tf.keras.models.load_model(filepath)
-        print("Debug: Model loaded successfully") 
\ No newline at end of file
+        self._infer = None
+        logger.debug("Model loaded successfully") 
\ No newline at end of file
@@ -0,0 +1,90 @@
+import numpy as np
+from PIL import Image
+import io
+from cairosvg import svg2png
+import os
+import hashlib
+
+# Rasterized training images are stored here by content hash, so unchanged SVGs are only rendered once
+IMAGE_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'tag-images')
+# Part of every cache key, bump it when rasterize_svg changes so old images are not reused
+RASTER_VERSION = 1
+# The least recently used images are deleted once the cache grows past this size
+IMAGE_CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+def rasterize_svg(svg_content, image_size):
+    """Convert SVG content to a uint8 RGB image array, the model rescales it to [0, 1]"""
+    # Convert SVG to PNG
+    png_data = svg2png(bytestring=svg_content)
+    
+    # Convert PNG to PIL Image
+    image = Image.open(io.BytesIO(png_data))
+    
+    # Convert to RGB (3 channels)
+    image = image.convert('RGB')
+    
+    # Resize to consistent size
+    image = image.resize(image_size)
+    
+    # Convert to numpy array, normalization happens in the model's Rescaling layer
+    return np.asarray(image, dtype=np.uint8)
+
+def rasterize_svg_cached(svg_content, image_size, cache_dir):
+    """Rasterize SVG content, reusing the image stored in cache_dir for identical content"""
+    if cache_dir is None:
+        return rasterize_svg(svg_content, image_size)
+    key = hashlib.blake2b(svg_content.encode('utf-8'), digest_size=16)
+    key.update(repr((RASTER_VERSION, tuple(image_size))).encode('ascii'))
+    path = os.path.join(cache_dir, key.hexdigest() + '.npy')
+    try:
+        img_array = np.load(path, mmap_mode='r')
+    except (FileNotFoundError, ValueError):
+        pass
+    else:
+        # Mark the image as recently used for prune_image_cache
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return img_array
+    img_array = rasterize_svg(svg_content, image_size)
+    # Write to a temporary file first so parallel workers never read a partial image
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.save(f, img_array)
+    os.replace(tmp_path, path)
+    return img_array
+
+def prune_image_cache(cache_dir, max_bytes=IMAGE_CACHE_MAX_BYTES):
+    """Delete the least recently used images from cache_dir until it fits in max_bytes"""
+    try:
+        entries = [(entry.stat(), entry.path) for entry in os.scandir(cache_dir) if entry.name.endswith('.npy')]
+    except FileNotFoundError:
+        return
+    total = sum(stat.st_size for stat, _ in entries)
+    for stat, path in sorted(entries, key=lambda entry: entry[0].st_mtime_ns):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= stat.st_size
+
+def rasterize_content(job):
+    """Rasterize SVG content in a worker process, returns (image, error)"""
+    svg_content, image_size, cache_dir = job
+    try:
+        return np.asarray(rasterize_svg_cached(svg_content, image_size, cache_dir)), None
+    except Exception as e:
+        return None, str(e)
+
+def rasterize_file(job):
+    """Read and rasterize one SVG file in a worker process, returns (image, error)"""
+    filename, image_size, cache_dir = job
+    try:
+        with open(filename, 'r') as f:
+            return np.asarray(rasterize_svg_cached(f.read(), image_size, cache_dir)), None
+    except Exception as e:
+        return None, str(e)
@@ -1,18 +1,60 @@
 import numpy as np
-from bs4 import BeautifulSoup
-import re
 import json
+import os
+import hashlib
+import functools
+import threading
+from collections import OrderedDict
 import cv2
-import io
-from cairosvg import svg2png
-from PIL import Image
+from cairosvg.parser import Tree
+from cairosvg.surface import PNGSurface
+from worker_pool import get_worker_pool, chunk_size
+
+# Rasterization size used for contour analysis
+ANALYSIS_SIZE = 256
+# Noise blur, sigma 1.1 (the 5x5 kernel's default) at the original 800px scaled to ANALYSIS_SIZE
+BLUR_SIGMA = 1.1 * ANALYSIS_SIZE / 800
+# Maximum number of analysis results kept in memory
+ANALYSIS_CACHE_SIZE = 1024
+
+# Default complexity thresholds, first matching name term wins
+DEFAULT_THRESHOLDS = (
+    (('circle', 'round', 'square', 'triangle'), (0, 30)),  # Simple shapes
+    (('text',), (10, 50)),  # Text elements
+    (('arrow',), (5, 40)),  # Arrows
+    (('heart',), (20, 60)),  # Hearts
+    (('multi', 'shape'), (40, float('inf'))),  # Complex shapes
+)
+
+# How a category is scored, first matching name term wins
+CATEGORY_KINDS = (
+    (('round', 'circle'), 'circles'),
+    (('square',), 'rectangles'),
+    (('triangle',), 'triangles'),
+    (('complex', 'shape'), 'complex'),
+    (('text',), 'text'),
+    (('heart',), 'heart'),
+    (('arrow',), 'arrow'),
+)
 
 class SVGAnalyzer:
     def __init__(self):
+        self._analysis_cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._categories_key = None
         self.update_categories_from_json()
 
     def update_categories_from_json(self, categories_file='categories.json'):
         """Update analyzer categories from JSON file"""
+        try:
+            key = (categories_file, os.stat(categories_file).st_mtime_ns)
+        except FileNotFoundError:
+            key = None
+        if key is not None and key == self._categories_key:
+            # File unchanged since the last load, keep categories and cached scores
+            return
+        self._categories_key = key
+        
         try:
             with open(categories_file, 'r') as f:
                 categories = json.load(f)
@@ -20,6 +62,7 @@ class SVGAnalyzer:
                 # Initialize keywords for each category
                 self.category_keywords = {}
                 self.complexity_thresholds = {}
+                self.category_kinds = {}
                 
                 for cat in categories:
                     name = cat['name'].lower()
@@ -27,41 +70,59 @@ class SVGAnalyzer:
                     self.category_keywords[name] = [kw.lower() for kw in cat.get('keywords', [])]
                     # Set default complexity thresholds
                     self.complexity_thresholds[name] = self._get_default_threshold(name)
+                    self.category_kinds[name] = self._get_category_kind(name)
         except (FileNotFoundError, json.JSONDecodeError):
             # Fallback to empty categories if file cannot be read
             self.category_keywords = {}
             self.complexity_thresholds = {}
+            self.category_kinds = {}
+        
+        # Scores depend on the categories, so cached results are stale now
+        self._analysis_cache.clear()
+
+    def _as_bytes(self, svg_content):
+        """Get the SVG content as UTF-8 bytes"""
+        if isinstance(svg_content, str):
+            return svg_content.encode('utf-8')
+        return svg_content
+
+    def _content_key(self, svg_content):
+        """Get a hash of the SVG content bytes to use as cache key"""
+        return hashlib.blake2b(svg_content, digest_size=16).digest()
 
     def _get_default_threshold(self, category_name):
         """Get default complexity threshold for a category"""
-        if any(term in category_name for term in ['circle', 'round', 'square', 'triangle']):
-            return (0, 30)  # Simple shapes
-        elif 'text' in category_name:
-            return (10, 50)  # Text elements
-        elif 'arrow' in category_name:
-            return (5, 40)  # Arrows
-        elif 'heart' in category_name:
-            return (20, 60)  # Hearts
-        elif 'multi' in category_name or 'shape' in category_name:
-            return (40, float('inf'))  # Complex shapes
-        else:
-            return (0, 100)  # Default range
+        for terms, threshold in DEFAULT_THRESHOLDS:
+            if any(term in category_name for term in terms):
+                return threshold
+        return (0, 100)  # Default range
+
+    def _get_category_kind(self, category_name):
+        """Get how a category is scored from its name"""
+        for terms, kind in CATEGORY_KINDS:
+            if any(term in category_name for term in terms):
+                return kind
+        return None
 
     def _svg_to_image(self, svg_content):
         """Convert SVG content to a numpy array image"""
-        # Convert SVG to PNG with higher resolution for better analysis
-        png_data = svg2png(bytestring=svg_content, output_width=800, output_height=800)
+        # Render small, the blur and noise area scale with the size so contours match the 800px analysis
+        surface = PNGSurface(Tree(bytestring=svg_content), None, 96,
+                             output_width=ANALYSIS_SIZE, output_height=ANALYSIS_SIZE)
         
-        # Convert PNG to numpy array
-        img = Image.open(io.BytesIO(png_data))
-        img_array = np.array(img)
-        
-        # Convert to grayscale while preserving image quality
-        if len(img_array.shape) > 2:
-            img_array = cv2.cvtColor(img_array, cv2.COLOR_RGBA2GRAY)
+        # Read cairo's BGRA pixels directly instead of encoding and decoding a PNG
+        cairo_surface = surface.cairo
+        cairo_surface.flush()
+        height, width = cairo_surface.get_height(), cairo_surface.get_width()
+        pixels = np.frombuffer(cairo_surface.get_data(), np.uint8)
+        pixels = pixels.reshape(height, cairo_surface.get_stride())[:, :width * 4].reshape(height, width, 4)
+        img_array = cv2.cvtColor(pixels, cv2.COLOR_BGRA2GRAY)
+        # Cairo stores colors premultiplied by alpha, undo that like the PNG decode did (transparent stays 0)
+        alpha = np.ascontiguousarray(pixels[..., 3])
+        cv2.divide(img_array, alpha, dst=img_array, scale=255)
         
         # Apply slight blur to reduce noise
-        img_array = cv2.GaussianBlur(img_array, (5, 5), 0)
+        cv2.GaussianBlur(img_array, (0, 0), BLUR_SIGMA, dst=img_array)
         
         return img_array
 
@@ -82,18 +143,24 @@ class SVGAnalyzer:
         
         # Filter out very small contours (noise)
         min_area = image.shape[0] * image.shape[1] * 0.001
-        contours = [cnt for cnt in contours if cv2.contourArea(cnt) > min_area]
+        areas = np.fromiter((cv2.contourArea(cnt) for cnt in contours), dtype=float, count=len(contours))
+        keep = np.flatnonzero(areas > min_area)
+        contours = [contours[i] for i in keep]
+        areas = areas[keep]
+        perimeters = np.fromiter((cv2.arcLength(cnt, True) for cnt in contours), dtype=float, count=len(contours))
         
-        for i, contour in enumerate(contours):
-            # Get perimeter and area
-            perimeter = cv2.arcLength(contour, True)
-            area = cv2.contourArea(contour)
-            
+        # Calculate circularity for all contours at once (perfect circle = 1.0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            circularities = 4 * np.pi * areas / (perimeters * perimeters)
+        
+        for contour, area, perimeter, circularity in zip(contours, areas, perimeters, circularities):
             if perimeter == 0:
                 continue
             
-            # Calculate circularity (perfect circle = 1.0)
-            circularity = 4 * np.pi * area / (perimeter * perimeter)
+            # Near-perfect circles are also convex, so skip the hull and ellipse fits
+            if circularity > 0.95:
+                shapes['circles'] += 1
+                continue
             
             # Get convex hull for additional shape analysis
             hull = cv2.convexHull(contour)
@@ -123,8 +190,6 @@ class SVGAnalyzer:
             
             # Get rotated rectangle for better shape analysis
             rect = cv2.minAreaRect(contour)
-            box = cv2.boxPoints(rect)
-            box = np.int0(box)
             width = rect[1][0]
             height = rect[1][1]
             aspect_ratio = min(width, height) / max(width, height) if max(width, height) > 0 else 0
@@ -141,85 +206,128 @@ class SVGAnalyzer:
 
     def analyze_svg(self, svg_content):
         """Analyseer SVG inhoud en retourneer waarschijnlijkheid per categorie"""
+        # Encode once, hashing and rendering then both work on the same bytes
+        svg_content = self._as_bytes(svg_content)
+        key = self._content_key(svg_content)
+        with self._cache_lock:
+            cached = self._analysis_cache.get(key)
+            if cached is not None:
+                self._analysis_cache.move_to_end(key)
+                return dict(cached)
+        
+        scores = self._analyze_uncached(svg_content)
+        self._store_scores(key, scores)
+        return dict(scores)
+
+    def analyze_batch(self, svg_contents, workers=None):
+        """Analyseer meerdere SVG's, wat nog niet in de cache staat wordt in worker processen geanalyseerd"""
+        svg_contents = [self._as_bytes(svg_content) for svg_content in svg_contents]
+        keys = [self._content_key(svg_content) for svg_content in svg_contents]
+        results = [None] * len(keys)
+        missing = {}  # Duplicate SVGs are analyzed once
+        with self._cache_lock:
+            for i, key in enumerate(keys):
+                cached = self._analysis_cache.get(key)
+                if cached is not None:
+                    self._analysis_cache.move_to_end(key)
+                    results[i] = dict(cached)
+                else:
+                    missing.setdefault(key, svg_contents[i])
+        
+        if missing:
+            # Rendering and contour fitting hold the GIL, so use processes rather than threads
+            contents = list(missing.values())
+            # Workers only count shapes, scoring happens here with this analyzer's categories
+            pool = get_worker_pool(len(contents), workers)
+            if pool is not None:
+                shape_counts = pool.map(_count_shapes_in_worker, contents, chunksize=chunk_size(len(contents)))
+            else:
+                shape_counts = [self._count_shapes(svg_content) for svg_content in contents]
+            
+            new_scores = {key: self._score_shapes(shapes) for key, shapes in zip(missing, shape_counts)}
+            for key, scores in new_scores.items():
+                self._store_scores(key, scores)
+            for i, key in enumerate(keys):
+                if results[i] is None:
+                    results[i] = dict(new_scores[key])
+        
+        return results
+
+    def _store_scores(self, key, scores):
+        """Add analysis scores to the cache, evicting the least recently used entry when full"""
+        # Don't cache failed analyses so they are retried
+        if scores:
+            with self._cache_lock:
+                self._analysis_cache[key] = scores
+                if len(self._analysis_cache) > ANALYSIS_CACHE_SIZE:
+                    self._analysis_cache.popitem(last=False)
+
+    def _analyze_uncached(self, svg_content):
+        """Run the full raster and contour analysis on SVG content"""
+        return self._score_shapes(self._count_shapes(svg_content))
+
+    def _count_shapes(self, svg_content):
+        """Count the shapes in SVG content, None when it cannot be analyzed"""
         try:
             image = self._svg_to_image(svg_content)
             shapes, contours = self._detect_shapes(image)
-            
-            scores = {}
-            total_shapes = sum(shapes.values())
-            
-            if total_shapes == 0:
-                return {name.lower(): 0.0 for name in self.category_keywords.keys()}
-            
-            for category_name in self.category_keywords.keys():
-                category_name = category_name.lower()
-                score = 0
-                
-                if 'round' in category_name or 'circle' in category_name:
-                    if shapes['circles'] > 0:
-                        # Perfect score for pure circles, high score for mostly circles
-                        circle_ratio = shapes['circles'] / total_shapes
-                        if circle_ratio == 1.0:
-                            score = 1.0
-                        elif circle_ratio > 0.5:
-                            score = 0.9
-                        else:
-                            score = 0.7 * circle_ratio
-                
-                elif 'square' in category_name:
-                    if shapes['rectangles'] > 0:
-                        rect_ratio = shapes['rectangles'] / total_shapes
-                        if rect_ratio == 1.0:
-                            score = 1.0
-                        elif rect_ratio > 0.5:
-                            score = 0.9
-                        else:
-                            score = 0.7 * rect_ratio
-                
-                elif 'triangle' in category_name:
-                    if shapes['triangles'] > 0:
-                        tri_ratio = shapes['triangles'] / total_shapes
-                        if tri_ratio == 1.0:
-                            score = 1.0
-                        elif tri_ratio > 0.5:
-                            score = 0.9
-                        else:
-                            score = 0.7 * tri_ratio
-                
-                elif 'complex' in category_name or 'shape' in category_name:
-                    # Score based on shape variety and complexity
-                    unique_shapes = sum(1 for count in shapes.values() if count > 0)
-                    if unique_shapes > 1:
-                        variety_score = min(1.0, unique_shapes / 3)
-                        count_score = min(1.0, total_shapes / 3)
-                        score = (variety_score + count_score) / 2
-                
-                elif 'text' in category_name:
-                    # Text detection would require OCR
-                    score = 0.1
-                
-                elif 'heart' in category_name:
-                    # Hearts typically have specific properties
-                    if shapes['other'] > 0 and total_shapes <= 2:
-                        score = 0.6
-                
-                elif 'arrow' in category_name:
-                    # Arrows typically have a specific shape pattern
-                    if shapes['other'] > 0 and total_shapes <= 3:
-                        score = 0.6
-                
-                scores[category_name] = score
-            
-            return scores
+            return shapes
             
         except Exception as e:
             print(f"Error analyzing image: {e}")
+            return None
+
+    def _score_shapes(self, shapes):
+        """Score every category from the shape counts, an empty dict for a failed analysis"""
+        if shapes is None:
             return {}
+        
+        total_shapes = sum(shapes.values())
+        
+        if total_shapes == 0:
+            return {name: 0.0 for name in self.category_kinds}
+        
+        # Shape counts are the same for every category, so score each kind once
+        kind_scores = {'text': 0.1}  # Text detection would require OCR
+        for kind in ('circles', 'rectangles', 'triangles'):
+            # Perfect score for pure shapes, high score for mostly one shape
+            ratio = shapes[kind] / total_shapes
+            if ratio == 1.0:
+                kind_scores[kind] = 1.0
+            elif ratio > 0.5:
+                kind_scores[kind] = 0.9
+            else:
+                kind_scores[kind] = 0.7 * ratio
+        
+        # Score based on shape variety and complexity
+        unique_shapes = sum(1 for count in shapes.values() if count > 0)
+        if unique_shapes > 1:
+            variety_score = min(1.0, unique_shapes / 3)
+            count_score = min(1.0, total_shapes / 3)
+            kind_scores['complex'] = (variety_score + count_score) / 2
+        
+        # Hearts and arrows are single irregular outlines
+        if shapes['other'] > 0 and total_shapes <= 2:
+            kind_scores['heart'] = 0.6
+        if shapes['other'] > 0 and total_shapes <= 3:
+            kind_scores['arrow'] = 0.6
+        
+        return {name: kind_scores.get(kind, 0) for name, kind in self.category_kinds.items()}
 
-    def suggest_category(self, svg_content):
-        """Suggereer de beste categorie voor een SVG"""
-        scores = self.analyze_svg(svg_content)
+    def suggest_category(self, svg_content, scores=None):
+        """Suggereer de beste categorie voor een SVG, hergebruik scores als die al bekend zijn"""
+        if scores is None:
+            scores = self.analyze_svg(svg_content)
         if not scores:
             return None, 0
         best_category, confidence = max(scores.items(), key=lambda x: x[1])
-        return best_category, confidence 
\ No newline at end of file
+        return best_category, confidence 
+
+@functools.lru_cache(maxsize=None)
+def get_analyzer():
+    """Geef een gedeelde analyzer terug, zodat categorieën en cache één keer per proces worden opgebouwd"""
+    return SVGAnalyzer()
+
+def _count_shapes_in_worker(svg_content):
+    """Count the shapes of one SVG in a worker process, shape detection does not depend on the categories"""
+    return get_analyzer()._count_shapes(svg_content)
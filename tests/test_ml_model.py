@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+tf = pytest.importorskip('tensorflow')
+pytest.importorskip('cairosvg')
+
+from ml_model import SVGTypingModel
+
+
+def _typing_model(outputs_fn):
+    """Wrap a small functional model with non-trivial BatchNormalization statistics"""
+    inputs = tf.keras.Input((4,))
+    model = tf.keras.Model(inputs, outputs_fn(inputs))
+    rng = np.random.default_rng(0)
+    for layer in model.layers:
+        if isinstance(layer, tf.keras.layers.BatchNormalization):
+            gamma, beta, mean, var = layer.get_weights()
+            layer.set_weights([
+                rng.uniform(0.5, 2.0, gamma.shape), rng.normal(size=beta.shape),
+                rng.normal(size=mean.shape), rng.uniform(0.5, 2.0, var.shape)
+            ])
+    typing_model = SVGTypingModel({})
+    typing_model.model = model
+    return typing_model
+
+
+def _assert_same_predictions(typing_model):
+    x = np.random.default_rng(1).normal(size=(5, 4)).astype(np.float32)
+    expected = typing_model.model(x, training=False)
+    actual = typing_model.fold_batch_norm()(x, training=False)
+    np.testing.assert_allclose(actual, expected, rtol=1e-4, atol=1e-4)
+
+
+def test_fold_batch_norm_into_linear_dense():
+    typing_model = _typing_model(lambda x: tf.keras.layers.BatchNormalization(name='bn')(tf.keras.layers.Dense(8)(x)))
+    _assert_same_predictions(typing_model)
+    assert isinstance(typing_model.fold_batch_norm().get_layer('bn'), tf.keras.layers.Activation)
+
+
+def test_fold_batch_norm_skips_activated_dense():
+    typing_model = _typing_model(lambda x: tf.keras.layers.Dense(3)(
+        tf.keras.layers.BatchNormalization(name='bn')(tf.keras.layers.Dense(8, activation='relu')(x))))
+    _assert_same_predictions(typing_model)
+    assert isinstance(typing_model.fold_batch_norm().get_layer('bn'), tf.keras.layers.BatchNormalization)
+
+
+def test_fold_batch_norm_skips_shared_producer():
+    def outputs(x):
+        dense = tf.keras.layers.Dense(8)(x)
+        return tf.keras.layers.Concatenate()([tf.keras.layers.BatchNormalization(name='bn')(dense), dense])
+    typing_model = _typing_model(outputs)
+    _assert_same_predictions(typing_model)
+    assert isinstance(typing_model.fold_batch_norm().get_layer('bn'), tf.keras.layers.BatchNormalization)
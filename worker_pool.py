@@ -0,0 +1,29 @@
+import os
+import atexit
+import threading
+import multiprocessing
+
+# Number of worker processes in the shared pool
+POOL_SIZE = os.cpu_count() or 1
+# Batches smaller than this run in the calling process, handing them to workers costs more than it saves
+MIN_POOL_JOBS = 8
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_worker_pool(job_count, workers=None):
+    """Get the process pool shared by all batch work, None when a batch of job_count jobs should run serially"""
+    global _pool
+    if min(workers or POOL_SIZE, job_count) <= 1 or job_count < MIN_POOL_JOBS:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            # Started once and reused, spawned workers re-import their modules so starting a pool per batch is slow
+            # Spawn rather than fork, forking after TensorFlow or Streamlit started threads can copy a held lock
+            _pool = multiprocessing.get_context('spawn').Pool(POOL_SIZE)
+            atexit.register(_pool.terminate)
+        return _pool
+
+def chunk_size(job_count):
+    """Get the chunksize that spreads job_count jobs over the pool in a few chunks per worker"""
+    return max(1, job_count // (POOL_SIZE * 4))